@@ -9,46 +9,75 @@ from __future__ import annotations
 
 import os
 import re
-from dataclasses import dataclass
 from enum import Enum
-from functools import partial
-from importlib.metadata import PackageNotFoundError, distribution
-from pathlib import Path
-from subprocess import run
-from textwrap import indent
+from functools import cache, cached_property, lru_cache, partial
+from pathlib import Path, PurePath
+from subprocess import DEVNULL, PIPE, run
 from typing import TYPE_CHECKING, Literal
 
 
 if TYPE_CHECKING:
     from collections.abc import Callable, Iterable
-    from importlib.metadata import Distribution
+    from importlib.metadata import Distribution, PackagePath
 
     from dunamai import Version
 
 
-RE_PEP440_VERSION = re.compile(
-    r"""
-(?:(?P<epoch>[0-9]+)!)?
-(?P<base>[0-9]+(?:\.[0-9]+)*)
-(?:
-    [-_.]?
-    (?P<stage>
-        a|b|c|rc|alpha|beta|pre|preview  # pre-releases
-        |post|rev|r
-        |dev
-    )
-    [-_.]?
-    (?P<revision>[0-9]+)?
-)*
-(?:-(?P<alt_post_revision>[0-9]+))?
-(?:\+(?P<tagged_metadata>[a-z0-9]+(?:[-_.][a-z0-9]+)*))?
-""",
-    re.VERBOSE,
+# Kept free of whitespace and comments so it needs no re.VERBOSE.
+# Each substring must have only one way to match, or failing matches backtrack
+# exponentially: “rc” can’t be “r” + “c”, and a separator after a stage
+# is only consumed if a revision number follows.
+_PEP440_SRC = (
+    r"(?:(?P<epoch>[0-9]+)!)?"
+    r"(?P<base>[0-9]+(?:\.[0-9]+)*)"
+    r"(?:"
+    r"[-_.]?"
+    r"(?P<stage>"
+    r"a|b|c|rc|alpha|beta|pre|preview"  # pre-releases
+    r"|post|rev|r(?!c)"
+    r"|dev"
+    r")"
+    r"(?:[-_.]?(?P<revision>[0-9]+))?"
+    r")*"
+    r"(?:-(?P<alt_post_revision>[0-9]+))?"
+    r"(?:\+(?P<tagged_metadata>[a-z0-9]+(?:[-_.][a-z0-9]+)*))?"
 )
-RE_GIT_DESCRIBE = r"v?(?:([\d.]+)-(\d+)-g)?([0-9a-f]{7})(-dirty)?"
+
+
+@lru_cache(maxsize=8)
+def compile_pep440(
+    prefix: str = "", suffix: str = "", group: str | None = None
+) -> re.Pattern[str]:
+    """Compile the PEP 440 pattern with surrounding context, once per context
+
+    If ``group`` is given, the whole version is captured in a group of that name.
+    """
+    src = _PEP440_SRC if group is None else f"(?P<{group}>{_PEP440_SRC})"
+    return re.compile(f"{prefix}{src}{suffix}")
+
+
+RE_PEP440_VERSION = compile_pep440()
+RE_DIRNAME = compile_pep440("[A-Za-z]+(?:[_-][A-Za-z]+)*-", "$", group="version")
+# dunamai only accepts pattern strings, so build this one once
+_DUNAMAI_PATTERN = f"v?{_PEP440_SRC}"
+RE_GIT_DESCRIBE = re.compile(r"v?(?:([\d.]+)-(\d+)-g)?([0-9a-f]{7})(-dirty)?")
+RE_GIT_TAG = re.compile(r"v?([0-9]+(?:\.[0-9]+)*)")
+GIT_LOG_CMD = ["git", "-c", "log.showsignature=false", "log"]
+# Tagged commits reachable from HEAD, in the order dunamai ranks their tags
+GIT_TAGS_CMD = [
+    *GIT_LOG_CMD,
+    "--simplify-by-decoration",
+    "--topo-order",
+    "--decorate=full",
+    "--decorate-refs=refs/tags/",
+    "--format=%D",
+    "HEAD",
+]
+GIT_STATUS_CMD = ["git", "status", "--porcelain"]
 ON_RTD = os.environ.get("READTHEDOCS") == "True"
 
 VCS = Literal["any", "git", "mercurial"]  # "darcs", "subversion", "bazaar", "fossil"
+VCS_MARKERS: dict[VCS, str] = {"git": ".git", "mercurial": ".hg"}
 
 
 class Source(Enum):
@@ -60,26 +89,29 @@ class Source(Enum):
     def __bool__(self) -> bool:
         return self is not Source.all
 
+    @cached_property
+    def prefix(self) -> str:
+        return f" via {self.value}" if self else ""
+
 
-@dataclass
 class NoVersionFound(RuntimeError):
     source: Source
     msg: str
 
+    def __init__(self, source: Source, msg: str) -> None:
+        super().__init__(source, msg)
+        self.source = source
+        self.msg = msg
+
     def __str__(self) -> str:
-        src = f" via {self.source.value}" if self.source else ""
         delim = "\n" if "\n" in self.msg else " "
-        return f"No version found{src}:{delim}{self.msg}"
+        return f"No version found{self.source.prefix}:{delim}{self.msg}"
 
 
 def get_version_from_dirname(parent: Path) -> str:
     """Extracted sdist"""
-    parent = parent.resolve()
-    re_dirname = re.compile(
-        f"[A-Za-z]+(?:[_-][A-Za-z]+)*-(?P<version>{RE_PEP440_VERSION.pattern})$",
-        re.VERBOSE,
-    )
-    match = re_dirname.match(parent.name)
+    # Skip the regex for names that can’t be “<name>-<version>”, e.g. checkouts
+    match = RE_DIRNAME.match(parent.name) if "-" in parent.name else None
     if not match:
         raise NoVersionFound(
             Source.dirname,
@@ -89,11 +121,7 @@ def get_version_from_dirname(parent: Path) -> str:
 
 
 def get_version_from_vcs(parent: Path, *, vcs: VCS = "any") -> str:
-    parent = parent.resolve()
-    try:
-        vcs_root = find_vcs_root(parent, vcs=vcs)
-    except OSError:
-        raise NoVersionFound(Source.vcs, "could not execute VCS command.")
+    vcs_root = find_vcs_root(parent, vcs=vcs)
     if vcs_root is None:
         raise NoVersionFound(
             Source.vcs, f"could not find VCS from directory “{parent}”."
@@ -102,8 +130,17 @@ def get_version_from_vcs(parent: Path, *, vcs: VCS = "any") -> str:
         raise NoVersionFound(
             Source.vcs, f"directory “{parent}” does not match VCS root “{vcs_root}”."
         )
+    if vcs == "any":
+        vcs = "git" if (parent / ".git").exists() else "mercurial"
+    if vcs == "git":
+        try:
+            version_str = get_version_from_git(parent)
+        except OSError:
+            raise NoVersionFound(Source.vcs, "could not execute VCS command.")
+        if version_str is not None:
+            return version_str
     try:
-        version = dunamai_get_from_vcs(parent)
+        version = dunamai_get_from_vcs(parent, vcs=vcs)
     except (RuntimeError, ImportError, ValueError) as e:
         raise NoVersionFound(
             Source.vcs,
@@ -118,66 +155,130 @@ def get_version_from_vcs(parent: Path, *, vcs: VCS = "any") -> str:
         )
 
 
+@lru_cache(maxsize=32)
 def find_vcs_root(start: Path, *, vcs: VCS = "any") -> Path | None:
-    from dunamai import Vcs, _detect_vcs
+    """Find the closest directory with VCS metadata without spawning VCS commands"""
+    markers = VCS_MARKERS.values() if vcs == "any" else [VCS_MARKERS[vcs]]
+    for dir_ in (start, *start.parents):
+        if any((dir_ / marker).exists() for marker in markers):
+            return dir_
+    return None
 
-    if vcs == "any":
-        try:
-            vcs_e = _detect_vcs(None, start)
-        except RuntimeError:
-            return None
-    else:
-        vcs_e = Vcs(vcs)
 
-    if vcs_e is Vcs.Git:
-        cmd = ["git", "rev-parse", "--show-toplevel"]
-    elif vcs_e is Vcs.Mercurial:
-        cmd = ["hg", "root"]
+def get_version_from_git(dir_: Path) -> str | None:
+    """Fast path for plain numeric tags, following dunamai’s algorithm.
+
+    The newest tag in topological order wins, the distance is the number of
+    commits since it, and untracked files count as dirty.
+    Returns ``None`` if dunamai needs to handle the repository.
+    """
+    if (dir_ / ".git_archival.json").is_file():
+        return None  # dunamai may read the version from there
+    log = run(GIT_TAGS_CMD, cwd=dir_, stdout=PIPE, stderr=DEVNULL)
+    if log.returncode != 0:
+        return None  # e.g. no commits, or git < 2.16
+    try:
+        decorations = log.stdout.decode("utf-8").splitlines()
+    except UnicodeDecodeError:
+        return None  # dunamai reports this
+    for decoration in decorations:
+        # “tag: refs/tags/v1.0, tag: refs/tags/v1.0.0”
+        refs = (ref.split()[-1] for ref in decoration.split(", ") if ref)
+        tags = [ref.removeprefix("refs/tags/") for ref in refs]
+        # Like dunamai’s unanchored pattern, skip tags without any version in them
+        tags = [tag for tag in tags if RE_PEP440_VERSION.search(tag)]
+        if tags:
+            break
     else:
-        raise NotImplementedError(
-            f"Please file a feature request to implement support for {vcs_e.value}."
-        )
-    ret = run(cmd, cwd=start, capture_output=True)
-    if ret.returncode != 0:
-        return None  # Swallow stderr. Maybe we should logging.debug() it instead?
-    return Path(os.fsdecode(ret.stdout.rstrip(b"\n")))
+        return None  # no tags with a version
+    if len(tags) != 1:
+        return None  # dunamai orders tags on the same commit by date
+    match = RE_GIT_TAG.fullmatch(tags[0])
+    if match is None:
+        return None
+
+    since_tag = [*GIT_LOG_CMD, "--format=%h", f"refs/tags/{tags[0]}..HEAD"]
+    commits = run(since_tag, cwd=dir_, stdout=PIPE, stderr=DEVNULL)
+    if commits.returncode != 0:
+        return None
+    hashes = commits.stdout.split()  # HEAD first
+
+    version = match[1]
+    metadata = []
+    if hashes:
+        version += f".post{len(hashes)}.dev0"
+        metadata.append(hashes[0].decode("ascii"))
+    if not ON_RTD:
+        status = run(GIT_STATUS_CMD, cwd=dir_, stdout=PIPE, stderr=DEVNULL)
+        if status.returncode != 0:
+            return None  # dunamai raises
+        if status.stdout.strip():
+            metadata.append("dirty")
+    if metadata:
+        version += "+" + ".".join(metadata)
+    return version
 
 
-def dunamai_get_from_vcs(dir_: Path) -> Version:
-    from dunamai import Version
+def dunamai_get_from_vcs(dir_: Path, *, vcs: VCS = "any") -> Version:
+    from dunamai import Vcs, Version
 
-    return Version.from_any_vcs(f"(?x)v?{RE_PEP440_VERSION.pattern}", path=dir_)
+    # With a known VCS, dunamai skips probing every VCS it supports
+    return Version.from_vcs(Vcs(vcs), _DUNAMAI_PATTERN, path=dir_)
 
 
+@cache
 def get_version_from_metadata(name: str, parent: Path | None = None) -> str:
+    # importlib.metadata is slow to import and not needed for sdists or VCS checkouts
+    from importlib.metadata import PackageNotFoundError
+
     try:
-        pkg = distribution(name)
+        pkg = find_distribution(name)
     except PackageNotFoundError:
         raise NoVersionFound(Source.metadata, f"could not find distribution “{name}”.")
 
+    if parent is None:  # Looked up by name, there is nothing to compare
+        return pkg.version
+
     # For an installed package, the parent is the install location,
     # For a dev package, it is the VCS repository.
-    (install_path,) = {p.parent.resolve() for p in get_pkg_paths(pkg)}
-    if parent is not None and parent.resolve() != install_path:
+    install_path = get_install_path(name)
+    if parent != install_path:
         msg = (
             "Distribution and package parent paths do not match;\n"
-            f"{parent.resolve()}\nis not\n{install_path}"
+            f"{parent}\nis not\n{install_path}"
         )
         raise NoVersionFound(Source.metadata, msg)
 
     return pkg.version
 
 
+@cache
+def find_distribution(name: str) -> Distribution:
+    """Like :func:`importlib.metadata.distribution`, but only scans sys.path once"""
+    from importlib.metadata import distribution
+
+    return distribution(name)
+
+
+@cache
+def get_install_path(name: str) -> Path:
+    pkg = find_distribution(name)
+    # Top level modules usually share a parent, so only resolve distinct ones.
+    (install_path,) = {p.resolve() for p in {p.parent for p in get_pkg_paths(pkg)}}
+    return install_path
+
+
 def get_pkg_paths(pkg: Distribution) -> list[Path]:
     # Some egg-info packages have e.g. src/ paths in their SOURCES.txt file,
     # but they also have this:
     mods = set((pkg.read_text("top_level.txt") or "").split())
     if not mods and pkg.files:
-        # Fall back to RECORD file for dist-info packages without top_level.txt
-        mods = {
-            f.parts[0] if len(f.parts) > 1 else f.with_suffix("").name
+        # Fall back to RECORD file for dist-info packages without top_level.txt.
+        # Only stat files when there are no Python files (e.g. symlinked packages).
+        mods = {get_top_level_name(f) for f in pkg.files if f.suffix == ".py"} or {
+            get_top_level_name(f)
             for f in pkg.files
-            if f.suffix == ".py" or Path(str(pkg.locate_file(f))).is_symlink()
+            if Path(str(pkg.locate_file(f))).is_symlink()
         }
     if not mods:
         raise RuntimeError(
@@ -186,6 +287,10 @@ def get_pkg_paths(pkg: Distribution) -> list[Path]:
     return [Path(str(pkg.locate_file(mod))) for mod in mods]
 
 
+def get_top_level_name(f: PackagePath) -> str:
+    return f.parts[0] if len(f.parts) > 1 else f.with_suffix("").name
+
+
 def get_version(
     package: Path | str,
     *,
@@ -211,32 +316,44 @@ def get_version(
                   you can specify it, e.g. in ``PIL/__init__.py``,
                   there would be ``get_version(__file__, 'Pillow')``
        vcs: Pass one of the supported VCSs to skip (slow) VCS detection
+
+    Results are cached per process, call :func:`clear_caches` to look them up again.
     """
-    path = Path(package)
-    if dist_name is None and not path.suffix and len(path.parts) == 1:
+    if dist_name is None and isinstance(package, str) and package.isidentifier():
+        # Without separators or dots, this is a bare name and needs no parsing
+        return get_version_from_metadata(package)
+    # Parse with string operations, pathlib creates a new object per step.
+    # One PurePath drops “.” components, but keeps “..” for resolve(),
+    # which has to follow symlinks before going up a directory.
+    head, tail = os.path.split(PurePath(package))
+    stem, suffix = os.path.splitext(tail)
+    if dist_name is None and not suffix and not head and tail != ".":
         # Is probably not a path
-        dist_name = path.name
-        return get_version_from_metadata(dist_name)
+        return get_version_from_metadata(tail)
 
-    if path.suffix != ".py":
+    if suffix != ".py":
         msg = (
             f"“{package}” is neither the name of an installed module "
             "nor the path to a .py file."
         )
-        if path.suffix:
-            msg += f" Unknown file suffix {path.suffix}"
+        if suffix:
+            msg += f" Unknown file suffix {suffix}"
         raise ValueError(msg)
-    if path.name == "__init__.py":
-        mod_name = path.parent.name
-        parent = path.parent.parent
+    if tail == "__init__.py":
+        head, mod_name = os.path.split(head)
     else:
-        mod_name = path.with_suffix("").name
-        parent = path.parent
+        mod_name = stem
     if dist_name is None:
         dist_name = mod_name
-    if parent.name == "src":
-        parent = parent.parent
+    if os.path.basename(head) == "src":
+        head = os.path.dirname(head)
+    # The get_version_from_* functions expect an already resolved path
+    return get_version_from_parent(Path(head).resolve(), dist_name, vcs=vcs)
+
 
+@cache
+def get_version_from_parent(parent: Path, dist_name: str, *, vcs: VCS = "any") -> str:
+    """Try all sources for a resolved parent directory, caching the result"""
     methods: Iterable[Callable[[Path], str]] = (
         get_version_from_dirname,
         partial(get_version_from_vcs, vcs=vcs),
@@ -254,12 +371,25 @@ def get_version(
         msg = "\n".join(f"- {e.source.value}:{maybe_indent(e.msg)}" for e in errors)
         raise NoVersionFound(Source.all, msg)
 
-    assert RE_PEP440_VERSION.match(version)
+    # Equivalent to RE_PEP440_VERSION.match(version), which only needs a digit
+    assert "0" <= version[:1] <= "9"
     return version
 
 
+def clear_caches() -> None:
+    """Forget all versions, VCS roots and distributions looked up so far"""
+    for cached in (
+        get_version_from_parent,
+        get_version_from_metadata,
+        find_distribution,
+        get_install_path,
+        find_vcs_root,
+    ):
+        cached.cache_clear()
+
+
 def maybe_indent(msg: str) -> str:
-    return f"\n{indent(msg, '  ')}" if "\n" in msg else f" {msg}"
+    return "\n  " + msg.replace("\n", "\n  ") if "\n" in msg else f" {msg}"
 
 
 __version__ = get_version(__file__, vcs="git")
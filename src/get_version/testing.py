@@ -10,7 +10,7 @@ import pytest
 
 if TYPE_CHECKING:
     from collections.abc import Callable, Generator, ItemsView, Iterator
-    from typing import Protocol, Union, runtime_checkable
+    from typing import Any, Protocol, Union, runtime_checkable
 
     @runtime_checkable
     class Desc(Protocol):
@@ -25,18 +25,25 @@ if TYPE_CHECKING:
     TempTreeCB = Callable[[Desc], Path]
 
 
+# Exact type lookup, so files don’t go through Mapping’s ABC instance check
+FILE_WRITERS: dict[type, Callable[[Path, Any], int]] = {
+    str: Path.write_text,
+    bytes: Path.write_bytes,
+}
+
+
 @pytest.fixture
 def temp_tree() -> Generator[TempTreeCB, None, None]:
     def mk_tree(desc: Desc, parent: Path) -> None:
-        parent.mkdir(parents=True, exist_ok=True)
+        """Fill ``parent``, which must already exist"""
         for name, content in desc.items():
             path = parent / name
-            if isinstance(content, str):
-                path.write_text(content)
-            elif isinstance(content, bytes):
-                path.write_bytes(content)
+            write = FILE_WRITERS.get(type(content))
+            if write is not None:
+                write(path, content)
             else:
                 assert isinstance(content, Mapping)
+                path.mkdir(parents=True, exist_ok=True)
                 mk_tree(content, path)
 
     dirs: list[TemporaryDirectory] = []
@@ -2,8 +2,8 @@ from __future__ import annotations
 
 import os
 import re
-from contextlib import contextmanager
-from pathlib import Path
+import tempfile
+from pathlib import Path, PurePath
 from subprocess import run
 from typing import TYPE_CHECKING
 
@@ -15,20 +15,35 @@ from get_version import NoVersionFound
 
 
 if TYPE_CHECKING:
-    from collections.abc import Callable, Generator
+    from collections.abc import Callable, Generator, Mapping, Sequence
 
+    from get_version import VCS
     from get_version.testing import Desc, TempTreeCB
 
 
-@contextmanager
-def chdir(dir_: os.PathLike | None = None) -> Generator[None, None, None]:
-    curdir = os.getcwd()
-    try:
-        if dir_ is not None:
-            os.chdir(dir_)
+# no template: skip copying sample hooks and info/exclude into every repo
+GIT_INIT_CMD = ["git", "init", "--template=", "-b", "main"]
+GIT_FAST_IMPORT_CMD = ["git", "fast-import", "--quiet"]
+GIT_READ_TREE_CMD = ["git", "read-tree", "HEAD"]  # fill the index
+GIT_IDENT = "A U Thor <author@example.com> 1700000000 +0000"
+
+
+@pytest.fixture(scope="session", autouse=True)
+def fast_env() -> Generator[None, None, None]:
+    """Keep test trees in RAM if possible, and make git skip fsync and config files.
+
+    Ignoring global and system config saves git looking them up on every spawn,
+    and keeps the tests independent of their contents.
+    """
+    with pytest.MonkeyPatch.context() as mp:
+        if os.access("/dev/shm", os.W_OK | os.X_OK):
+            mp.setattr(tempfile, "tempdir", "/dev/shm")
+        mp.setenv("GIT_CONFIG_GLOBAL", os.devnull)
+        mp.setenv("GIT_CONFIG_NOSYSTEM", "1")
+        mp.setenv("GIT_CONFIG_COUNT", "1")
+        mp.setenv("GIT_CONFIG_KEY_0", "core.fsync")
+        mp.setenv("GIT_CONFIG_VALUE_0", "none")
         yield
-    finally:
-        os.chdir(curdir)
 
 
 @pytest.fixture(params=[True, False], ids=["src", "plain"])
@@ -36,36 +51,59 @@ def has_src(request: pytest.FixtureRequest) -> bool:
     return request.param
 
 
+def git_history(repo: Path, path: PurePath, contents: Sequence[str], tag: str) -> str:
+    """Init a repo with one commit per content of ``path``, and tag the first one.
+
+    The objects are streamed into a single ``git fast-import`` process,
+    so the worktree file is left alone and only written by the caller.
+    Returns the abbreviated hash of the last commit.
+    """
+    stream = ""
+    for i, content in enumerate(contents, 1):
+        msg = "initial" if i == 1 else f"change {i - 1}"
+        stream += f"commit refs/heads/main\nmark :{i}\n"
+        stream += f"author {GIT_IDENT}\ncommitter {GIT_IDENT}\n"
+        stream += f"data {len(msg)}\n{msg}\n"
+        if i > 1:
+            stream += f"from :{i - 1}\n"
+        stream += f"M 100644 inline {path.as_posix()}\n"
+        stream += f"data {len(content.encode())}\n{content}\n"
+    stream += f"reset refs/tags/{tag}\nfrom :1\n\n"
+    stream += f"get-mark :{len(contents)}\n"  # answered on stdout
+    return fast_import(repo, stream)[:7].decode("ascii")
+
+
+def fast_import(repo: Path, stream: str) -> bytes:
+    """Init a repo from a fast-import ``stream`` and return fast-import’s output"""
+    run(GIT_INIT_CMD, cwd=repo, check=True)
+    imported = run(
+        GIT_FAST_IMPORT_CMD,
+        input=stream.encode(),
+        cwd=repo,
+        capture_output=True,
+        check=True,
+    )
+    run(GIT_READ_TREE_CMD, cwd=repo, check=True)
+    return imported.stdout
+
+
 @pytest.mark.parametrize("with_v", [True, False], ids=["with_v", "without_v"])
 @pytest.mark.parametrize("version", [Version("0.1.2"), Version("1", stage=("a", 2))])
 def test_git(
     temp_tree: TempTreeCB, has_src: bool, with_v: bool, version: Version
 ) -> None:
     src_path = Path("git_mod.py")
-    content: Desc = {src_path: "print('hello')\n"}
+    content: Desc = {src_path: "print('dirty')\n"}
     if has_src:
         src_path = Path("src") / src_path
         content = dict(src=content)
     package = temp_tree(content)
-    with chdir(package):
-
-        def add_and_commit(msg: str) -> None:
-            run(["git", "add", str(src_path)], check=True)
-            run(["git", "commit", "-m", msg], check=True)
-
-        run(["git", "init", "-b", "main"], check=True)
-        run(["git", "config", "user.name", "A U Thor"], check=True)
-        run(["git", "config", "user.email", "author@example.com"], check=True)
-        add_and_commit("initial")
-        run(["git", "tag", f"{'v' if with_v else ''}{version}"], check=True)
-        src_path.write_text("print('modified')")
-        add_and_commit("modified")
-        hash = run(
-            "git rev-parse --short HEAD".split(),
-            capture_output=True,
-            encoding="ascii",
-        ).stdout.strip()
-        src_path.write_text("print('dirty')")
+    hash = git_history(
+        package,
+        src_path,
+        ["print('hello')\n", "print('modified')\n"],
+        tag=f"{'v' if with_v else ''}{version}",
+    )
 
     v = get_version.dunamai_get_from_vcs(package)
     assert (
@@ -86,6 +124,91 @@ def test_git(
     assert f"{version}.post1.dev0+{hash}.dirty" == v_str
 
 
+def test_git_cached(temp_tree: TempTreeCB) -> None:
+    package = temp_tree({"cached_mod.py": "print('hello')\n"})
+    git_history(package, PurePath("cached_mod.py"), ["print('hello')\n"], tag="v0.1")
+
+    assert "0.1" == get_version.get_version(package / "cached_mod.py")
+    (package / "cached_mod.py").write_text("print('dirty')\n")
+    assert "0.1" == get_version.get_version(package / "cached_mod.py")
+    get_version.clear_caches()
+    assert "0.1+dirty" == get_version.get_version(package / "cached_mod.py")
+
+
+def merge_history(tags: Mapping[str, int]) -> str:
+    """A side branch merged into main with --no-ff, with ``tags`` on commit marks
+
+    ``git describe`` counts one commit too many since a tag on ``:3``.
+    """
+    commits = [  # branch, parent marks, added files
+        ("main", [], ["r"]),
+        ("side", [1], ["s1"]),
+        ("side", [2], ["s2"]),
+        ("side", [3], ["s3"]),
+        ("main", [1], ["m1"]),
+        ("main", [5], ["m2"]),
+        ("main", [6, 4], ["s1", "s2", "s3"]),
+    ]
+    stream = ""
+    for mark, (branch, parents, names) in enumerate(commits, 1):
+        stream += f"commit refs/heads/{branch}\nmark :{mark}\n"
+        stream += f"author {GIT_IDENT}\ncommitter {GIT_IDENT}\ndata 1\n{mark}\n"
+        stream += "".join(
+            f"{'merge' if i else 'from'} :{p}\n" for i, p in enumerate(parents)
+        )
+        stream += "".join(f"M 100644 inline {n}\ndata 2\n{n[0]}\n" for n in names)
+        stream += "\n"
+    for tag, mark in tags.items():
+        stream += f"reset refs/tags/{tag}\nfrom :{mark}\n\n"
+    return stream
+
+
+@pytest.mark.parametrize(
+    ("tags", "files", "fast"),
+    [
+        pytest.param({"1.0": 1, "2.0": 7}, {}, True, id="tag_at_head"),
+        pytest.param({"1.0": 1, "2.0": 7}, {"new": "\n"}, True, id="untracked"),
+        pytest.param({"1.0": 1, "2.0": 7}, {"r": "changed\n"}, True, id="modified"),
+        pytest.param({"1.0": 1, "2.0": 6}, {}, True, id="distance"),
+        pytest.param({"1.0": 1, "v2.0": 3}, {}, True, id="merge"),
+        pytest.param({"1.0": 1, "2.0": 3, "1.5": 6}, {}, True, id="both_branches"),
+        pytest.param({"1.0": 1, "latest": 6}, {}, True, id="unversioned_tag"),
+        pytest.param({"1.0": 1, "1.1": 1}, {}, False, id="same_commit"),
+        pytest.param({"1.0": 1, "2.0rc1": 3}, {}, False, id="pre_release"),
+    ],
+)
+def test_git_fast_path(
+    temp_tree: TempTreeCB, tags: dict[str, int], files: dict[str, str], fast: bool
+) -> None:
+    tree: Desc = {n: f"{n[0]}\n" for n in ["r", "s1", "s2", "s3", "m1", "m2"]}
+    package = temp_tree(tree)
+    fast_import(package, merge_history(tags))
+    for name, content in files.items():
+        (package / name).write_text(content)
+
+    expected = get_version.dunamai_get_from_vcs(package, vcs="git").serialize(
+        dirty=True
+    )
+    v = get_version.get_version_from_git(package)
+    assert (v is not None) == fast
+    assert v in {None, expected}
+    assert expected == get_version.get_version_from_vcs(package, vcs="git")
+
+
+@pytest.mark.parametrize(
+    ("marker", "vcs", "other"),
+    [(".git", "git", "mercurial"), (".hg", "mercurial", "git")],
+)
+def test_find_vcs_root(
+    temp_tree: TempTreeCB, marker: str, vcs: VCS, other: VCS
+) -> None:
+    package = temp_tree({marker: {}, "sub": {"mod.py": "print('hi!')\n"}})
+    assert package == get_version.find_vcs_root(package / "sub")
+    assert package == get_version.find_vcs_root(package / "sub", vcs=vcs)
+    assert get_version.find_vcs_root(package / "sub", vcs=other) is None
+    assert get_version.find_vcs_root(package.parent) is None
+
+
 @pytest.mark.parametrize("version", ["0.1.3+dirty", "1.2.post29.dev0+41ced3e.dirty"])
 @pytest.mark.parametrize("distname", ["dir_mod", "dir-mod", "mod"])
 def test_dir(temp_tree: TempTreeCB, has_src: bool, version: str, distname: str) -> None:
@@ -114,6 +237,13 @@ def test_dir_dash(temp_tree: TempTreeCB) -> None:
     assert "0.1" == v
 
 
+@pytest.mark.parametrize("version", ["1" + ".r" * 100, "1" + "rc" * 100])
+def test_dir_no_backtracking(version: str) -> None:
+    # These took exponential time when the PEP 440 regex had ambiguous branches
+    with pytest.raises(NoVersionFound):
+        get_version.get_version_from_dirname(Path(f"mod-{version}!"))
+
+
 def test_metadata() -> None:
     expected = pytest.__version__
 
@@ -166,3 +296,37 @@ def test_error(
     package = temp_tree(spec)
     with pytest.raises(e_cls, match=msg):
         gv_fn(package / "mod_dev_dir" / path)
+
+
+@pytest.mark.parametrize("package", ["", ".", Path()], ids=["empty", "dot", "path"])
+def test_error_no_name(package: str | Path) -> None:
+    with pytest.raises(ValueError, match=r"neither the name of an installed module"):
+        get_version.get_version(package)
+
+
+def test_dot_components(temp_tree: TempTreeCB) -> None:
+    assert pytest.__version__ == get_version.get_version("./pytest")
+    spec: Desc = {"proj-1.0": {"src": {"mod.py": "", "pkg": {"__init__.py": ""}}}}
+    src = temp_tree(spec) / "proj-1.0" / "src"
+    assert "1.0" == get_version.get_version(f"{src}/./mod.py")
+    assert "1.0" == get_version.get_version(f"{src}/pkg/./__init__.py")
+
+
+def test_symlink_parent(temp_tree: TempTreeCB) -> None:
+    spec: Desc = {"proj-1.0": {"inner": {}, "mod.py": ""}, "other": {"mod.py": ""}}
+    package = temp_tree(spec)
+    (package / "other" / "link").symlink_to(Path("..", "proj-1.0", "inner"))
+    # “..” applies to the symlink target, not to “other/link” as text
+    v = get_version.get_version(package / "other" / "link" / ".." / "mod.py")
+    assert "1.0" == v
+
+
+@pytest.mark.parametrize(("msg", "expected"), [("a", " a"), ("a\nb", "\n  a\n  b")])
+def test_maybe_indent(msg: str, expected: str) -> None:
+    assert expected == get_version.maybe_indent(msg)
+
+
+def test_temp_tree_shared_dirs(temp_tree: TempTreeCB) -> None:
+    package = temp_tree({"a/b": {"f.py": ""}, "a": {"g.py": ""}})
+    assert (package / "a" / "b" / "f.py").is_file()
+    assert (package / "a" / "g.py").is_file()